@@ -4,17 +4,127 @@ Recruitment Agent Web Application
 Simple Flask app demonstrating Bedrock Agent integration
 """
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, g, render_template, request
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+import boto3
+import botocore.session
+from botocore.config import Config
+import orjson
 from bedrock_integration import BedrockAgentIntegration
+from response_cache import ExactCache, SemanticCache, make_cache_key
 import json
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'recruitment-agent-demo-key')
 
-# Initialize Bedrock integration
-bedrock = BedrockAgentIntegration()
+class ORJSONResponse(Response):
+    """JSON response serialized with orjson, which emits bytes directly"""
+    default_mimetype = 'application/json'
+
+def ojsonify(obj):
+    """Drop-in for jsonify backed by orjson"""
+    return ORJSONResponse(orjson.dumps(obj))
+
+# Shared client config: a larger connection pool than botocore's default of 10
+# and keep-alive, so concurrent requests reuse warm TLS connections. Adaptive
+# retries back off client-side when Bedrock starts throttling.
+BEDROCK_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    connect_timeout=3,
+    read_timeout=60,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+
+# Every boto3 client created from the default session picks up the config above
+_botocore_session = botocore.session.get_session()
+_botocore_session.set_default_client_config(BEDROCK_CLIENT_CONFIG)
+boto3.setup_default_session(botocore_session=_botocore_session)
+
+# Load the service model once at import so the first request doesn't parse it
+_botocore_session.get_service_model('bedrock-agent-runtime')
+
+@lru_cache(maxsize=None)
+def get_bedrock():
+    """Return the process-wide Bedrock integration, created on first use"""
+    return BedrockAgentIntegration()
+
+@lru_cache(maxsize=None)
+def get_agent_dispatch():
+    """Return an immutable agent_type -> agent id mapping and the supervisor fallback"""
+    agents = get_bedrock().agents
+    return MappingProxyType(dict(agents)), agents['supervisor']
+
+# The session ID only names a Bedrock conversation, so it travels as a plain
+# header/cookie rather than in Flask's signed session cookie
+SESSION_HEADER = 'X-Session-Id'
+SESSION_COOKIE = 'session_id'
+
+def get_session_id():
+    """Return the caller's session ID, creating one on first use"""
+    if 'session_id' not in g:
+        session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+        g.new_session = not session_id
+        g.session_id = session_id or str(uuid.uuid4())
+    return g.session_id
+
+@app.after_request
+def send_new_session_id(response):
+    """Hand a newly created session ID back to the client"""
+    if g.get('new_session'):
+        response.headers[SESSION_HEADER] = g.session_id
+        response.set_cookie(SESSION_COOKIE, g.session_id, httponly=True, samesite='Lax')
+    return response
+
+# Exact-match cache for endpoints with structured, often re-submitted inputs
+exact_cache = ExactCache(ttl=int(os.environ.get('CACHE_TTL', 3600)))
+
+def cached_call(endpoint, inputs, call):
+    """
+    Return a cached response for identical inputs, otherwise call Bedrock and
+    cache a successful response. Only the response text is cached, so a hit
+    carries session_id None: no Bedrock session saw this caller's request,
+    and the one issued to whoever filled the entry is never handed out.
+    """
+    key = make_cache_key(endpoint, **inputs)
+    response = exact_cache.get(key)
+    if response is not None:
+        return {'success': True, 'response': response, 'session_id': None}
+    
+    result = call()
+    if result['success']:
+        exact_cache.set(key, result['response'])
+    return result
+
+def run_analyze_resume(resume_text, target_role):
+    """Resume analysis through the exact-match cache"""
+    return cached_call(
+        'analyze_resume',
+        {'resume_text': resume_text, 'target_role': target_role},
+        lambda: get_bedrock().analyze_resume(resume_text, target_role)
+    )
+
+def run_learning_plan(skills_gap, target_role):
+    """Learning plan generation through the exact-match cache"""
+    return cached_call(
+        'learning_plan',
+        {'skills_gap': skills_gap, 'target_role': target_role},
+        lambda: get_bedrock().generate_learning_plan(skills_gap, target_role)
+    )
+
+# Runs the independent Bedrock calls of /api/full-analysis side by side
+# (greenlets rather than OS threads under the gevent worker)
+full_analysis_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('FULL_ANALYSIS_WORKERS', 32)))
+
+# Semantic response cache for /api/chat, off unless CACHE_ENABLED is set
+if os.environ.get('CACHE_ENABLED', '').lower() in ('1', 'true', 'yes'):
+    semantic_cache = SemanticCache(ttl=int(os.environ.get('CACHE_TTL', 3600)))
+else:
+    semantic_cache = None
 
 @app.route('/')
 def index():
@@ -30,29 +140,46 @@ def chat():
         agent_type = data.get('agent', 'supervisor')  # supervisor, resume_parser, resume_reviewer
         
         if not message:
-            return jsonify({'error': 'Message is required'}), 400
+            return ojsonify({'error': 'Message is required'}), 400
         
         # Get or create session ID
-        if 'session_id' not in session:
-            session['session_id'] = str(uuid.uuid4())
+        session_id = get_session_id()
+        
+        # Serve near-identical questions from the cache. Entries are scoped to
+        # this session's conversation with this agent, and short follow-ups
+        # ("yes", "tell me more") are never cached
+        use_cache = semantic_cache is not None and semantic_cache.cacheable(message)
+        if use_cache:
+            cache_scope = (agent_type, session_id)
+            embedding = semantic_cache.embed(message)
+            cached_response = semantic_cache.get(cache_scope, embedding)
+            if cached_response is not None:
+                return ojsonify({
+                    'response': cached_response,
+                    'agent': agent_type,
+                    'session_id': session_id
+                })
         
         # Select agent
-        agent_id = bedrock.agents.get(agent_type, bedrock.agents['supervisor'])
+        agent_dispatch, default_agent = get_agent_dispatch()
+        agent_id = agent_dispatch.get(agent_type, default_agent)
         
         # Invoke agent
-        result = bedrock.invoke_agent(agent_id, message, session['session_id'])
+        result = get_bedrock().invoke_agent(agent_id, message, session_id)
         
         if result['success']:
-            return jsonify({
+            if use_cache:
+                semantic_cache.put(cache_scope, embedding, result['response'])
+            return ojsonify({
                 'response': result['response'],
                 'agent': agent_type,
                 'session_id': result['session_id']
             })
         else:
-            return jsonify({'error': result['error']}), 500
+            return ojsonify({'error': result['error']}), 500
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
 @app.route('/api/analyze-resume', methods=['POST'])
 def analyze_resume():
@@ -63,20 +190,20 @@ def analyze_resume():
         target_role = data.get('target_role', '')
         
         if not resume_text:
-            return jsonify({'error': 'Resume text is required'}), 400
+            return ojsonify({'error': 'Resume text is required'}), 400
         
-        result = bedrock.analyze_resume(resume_text, target_role)
+        result = run_analyze_resume(resume_text, target_role)
         
         if result['success']:
-            return jsonify({
+            return ojsonify({
                 'analysis': result['response'],
                 'session_id': result['session_id']
             })
         else:
-            return jsonify({'error': result['error']}), 500
+            return ojsonify({'error': result['error']}), 500
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
 @app.route('/api/career-guidance', methods=['POST'])
 def career_guidance():
@@ -85,18 +212,18 @@ def career_guidance():
         data = request.get_json()
         user_profile = data.get('profile', {})
         
-        result = bedrock.get_career_guidance(user_profile)
+        result = get_bedrock().get_career_guidance(user_profile)
         
         if result['success']:
-            return jsonify({
+            return ojsonify({
                 'guidance': result['response'],
                 'session_id': result['session_id']
             })
         else:
-            return jsonify({'error': result['error']}), 500
+            return ojsonify({'error': result['error']}), 500
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
 @app.route('/api/learning-plan', methods=['POST'])
 def learning_plan():
@@ -107,25 +234,66 @@ def learning_plan():
         target_role = data.get('target_role', '')
         
         if not skills_gap or not target_role:
-            return jsonify({'error': 'Skills gap and target role are required'}), 400
+            return ojsonify({'error': 'Skills gap and target role are required'}), 400
         
-        result = bedrock.generate_learning_plan(skills_gap, target_role)
+        result = run_learning_plan(skills_gap, target_role)
         
         if result['success']:
-            return jsonify({
+            return ojsonify({
                 'plan': result['response'],
                 'session_id': result['session_id']
             })
         else:
-            return jsonify({'error': result['error']}), 500
+            return ojsonify({'error': result['error']}), 500
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
+
+@app.route('/api/full-analysis', methods=['POST'])
+def full_analysis():
+    """Resume analysis, career guidance and learning plan in one request"""
+    try:
+        data = request.get_json()
+        resume_text = data.get('resume_text', '')
+        target_role = data.get('target_role', '')
+        user_profile = data.get('profile', {})
+        skills_gap = data.get('skills_gap', [])
+        
+        if not resume_text:
+            return ojsonify({'error': 'Resume text is required'}), 400
+        
+        # Start all calls before waiting on any of them
+        futures = {
+            'analysis': full_analysis_executor.submit(run_analyze_resume, resume_text, target_role),
+            'guidance': full_analysis_executor.submit(get_bedrock().get_career_guidance, user_profile)
+        }
+        if skills_gap and target_role:
+            futures['plan'] = full_analysis_executor.submit(run_learning_plan, skills_gap, target_role)
+        
+        response = {}
+        errors = {}
+        for name, future in futures.items():
+            result = future.result()
+            if result['success']:
+                response[name] = result['response']
+            else:
+                errors[name] = result['error']
+        
+        if errors:
+            response['errors'] = errors
+            if len(errors) == len(futures):
+                return ojsonify(response), 500
+        
+        return ojsonify(response)
+        
+    except Exception as e:
+        return ojsonify({'error': str(e)}), 500
 
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
+    bedrock = get_bedrock()
+    return ojsonify({
         'status': 'healthy',
         'agents': list(bedrock.agents.keys()),
         'knowledge_base': bedrock.knowledge_base_id
@@ -135,6 +303,8 @@ if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
     
+    bedrock = get_bedrock()
+    
     print("🚀 Starting Recruitment Agent Application...")
     print("📊 Available agents:", list(bedrock.agents.keys()))
     print("🧠 Knowledge Base ID:", bedrock.knowledge_base_id)
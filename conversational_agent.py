@@ -3,13 +3,161 @@ Conversational Agent - Hybrid approach that adds intelligent conversation
 while keeping the existing system intact.
 """
 
-from langchain.agents import create_openai_functions_agent, AgentExecutor
-from langchain.tools import Tool
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 import json
+import re
+from collections import namedtuple
 from datetime import datetime
+from functools import lru_cache, wraps
+from string import Template
+from types import SimpleNamespace
+from typing import List, Optional
+
+@lru_cache(maxsize=None)
+def _load_backend():
+    """
+    Import the LangChain stack on first use. It adds hundreds of ms and a lot
+    of memory to startup, which every app worker would otherwise pay even
+    when the coach is never opened.
+    """
+    from langchain.agents import create_openai_tools_agent, AgentExecutor
+    from langchain.tools import StructuredTool
+    from langchain_openai import ChatOpenAI
+    from langchain.memory import ConversationBufferWindowMemory
+    from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+    import openai
+    
+    return SimpleNamespace(
+        openai=openai,
+        create_openai_tools_agent=create_openai_tools_agent,
+        AgentExecutor=AgentExecutor,
+        StructuredTool=StructuredTool,
+        ChatOpenAI=ChatOpenAI,
+        ConversationBufferWindowMemory=ConversationBufferWindowMemory,
+        ChatPromptTemplate=ChatPromptTemplate,
+        MessagesPlaceholder=MessagesPlaceholder
+    )
+
+# Tags the agent's own LLM so streamed tokens can be told apart from the
+# LLM calls made inside tools
+AGENT_LLM_TAG = "coach_agent_llm"
+
+# Static system prompt. Kept byte-identical and first in every request so
+# OpenAI's automatic prompt caching can reuse the processed prefix
+# (system prompt + tool schemas) across turns and users.
+SYSTEM_MESSAGE = """\
+You are Euron, an expert AI Career Coach with years of experience helping people advance their careers.
+
+Your personality:
+- Encouraging and supportive, but realistic
+- Expert in technology careers (AI, software development, data, cloud)
+- Great at breaking down complex career paths into actionable steps
+- Always provide specific, practical advice
+- Remember context from previous conversations
+
+Your approach:
+1. Listen carefully to understand the user's situation
+2. Use available tools to provide detailed, personalized advice
+3. Always be encouraging while being honest about challenges
+4. Provide specific next steps, not just general advice
+5. Reference their resume analysis when relevant
+
+Available tools help you:
+- Explain resume analysis results clearly
+- Create personalized learning paths
+- Provide motivational coaching
+- Give career transition advice
+- Help with interview preparation
+
+Always end responses with a question to keep the conversation going and show you care about their progress.
+"""
+
+# Tool prompt templates, built once at import
+SUGGEST_LEARNING_PATH_TMPL = Template("""\
+As a career coach, suggest a personalized learning path for someone who wants to: $user_goal
+
+Their current skills: $current_skills
+Their timeline: $timeline
+
+Provide:
+1. Immediate next steps (this week)
+2. Short-term goals (1-3 months) 
+3. Long-term vision (6-12 months)
+4. Specific actionable advice
+
+Be encouraging and realistic.
+""")
+
+MOTIVATIONAL_COACHING_TMPL = Template("""\
+As an encouraging career coach, address this concern: $user_concern
+
+Progress context: $progress_data
+
+Provide:
+1. Acknowledgment of their concern
+2. Realistic perspective
+3. Actionable next steps
+4. Motivational encouragement
+
+Be empathetic, practical, and inspiring.
+""")
+
+CAREER_TRANSITION_TMPL = Template("""\
+Help someone transition from $current_role to $target_role.
+Experience level: $experience_level
+
+Provide:
+1. Key skills to develop
+2. Common transition challenges
+3. Timeline expectations
+4. Networking strategies
+5. Portfolio/project recommendations
+
+Be specific and actionable.
+""")
+
+INTERVIEW_PREP_TMPL = Template("""\
+Help prepare for $role interviews.
+Experience level: $experience_level
+Specific concerns: $specific_concerns
+
+Provide:
+1. Common interview questions for this role
+2. How to present experience effectively
+3. Technical preparation tips
+4. Confidence-building strategies
+5. Questions to ask the interviewer
+
+Be practical and confidence-building.
+""")
+
+# Canned replies for small talk, answered without calling the LLM
+_GREETING_REPLY = (
+    "Hi! I'm Euron, your AI career coach. What would you like to work on today - "
+    "your resume, a learning plan, a career move, or interview prep?"
+)
+_THANKS_REPLY = "You're welcome! Is there anything else I can help you with on your career journey?"
+_BYE_REPLY = "Good luck with your learning! Come back anytime to check in on your progress."
+
+QUICK_REPLIES = {
+    "": _GREETING_REPLY,
+    "hi": _GREETING_REPLY,
+    "hello": _GREETING_REPLY,
+    "hey": _GREETING_REPLY,
+    "thanks": _THANKS_REPLY,
+    "thank you": _THANKS_REPLY,
+    "bye": _BYE_REPLY
+}
+
+# Slightly longer variants such as "hey there!" or "thank you so much"
+_SMALL_TALK_RE = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|bye)(?: there| euron| so much| a lot| again)?[\s!.,]*$"
+)
+
+# One row of a user's learning plan, in learning_plans column order
+LearningPlanItem = namedtuple(
+    'LearningPlanItem',
+    'skill current target course resource duration'
+)
 
 class ConversationalCareerCoach:
     """
@@ -18,213 +166,216 @@ class ConversationalCareerCoach:
     """
     
     def __init__(self, api_key):
+        lc = _load_backend()
         self.api_key = api_key
-        self.llm = ChatOpenAI(model="gpt-4o", api_key=api_key, temperature=0.7)
-        self.memory = ConversationBufferWindowMemory(
+        self.llm = lc.ChatOpenAI(
+            model="gpt-4o",
+            api_key=api_key,
+            temperature=0.7,
+            max_retries=2,
+            request_timeout=30
+        )
+        self.memory = lc.ConversationBufferWindowMemory(
             memory_key="chat_history",
+            input_key="input",  # context is a second prompt input
             return_messages=True,
             k=10  # Remember last 10 exchanges
         )
         self.agent_executor = self._create_agent()
+        # (context, serialized) of the last context passed to chat
+        self._context_cache = (None, None)
+        self._summary_template = lc.ChatPromptTemplate.from_messages([
+            ("system", (
+                "Summarize this career coaching conversation. Provide a brief summary of:\n"
+                "1. Main topics discussed\n"
+                "2. Key advice given\n"
+                "3. User's goals/concerns"
+            )),
+            ("human", "{transcript}")
+        ])
+    
+    def _llm_tool(self, build_prompt):
+        """
+        Turn a prompt builder into a sync function and an async coroutine
+        that send the prompt to the LLM. Both keep the builder's signature
+        so the tool argument schema can be inferred from it.
+        """
+        @wraps(build_prompt)
+        def run(*args, **kwargs):
+            return self.llm.invoke(build_prompt(*args, **kwargs)).content
+        
+        @wraps(build_prompt)
+        async def arun(*args, **kwargs):
+            response = await self.llm.ainvoke(build_prompt(*args, **kwargs))
+            return response.content
+        
+        return run, arun
     
     def _create_tools(self):
         """Create tools that the agent can use"""
+        lc = _load_backend()
         
-        def explain_analysis_tool(analysis_data: str) -> str:
+        def explain_analysis_tool(
+            overall_score: Optional[int] = None,
+            strengths: Optional[List[str]] = None,
+            missing_skills: Optional[List[str]] = None
+        ) -> str:
             """Explain resume analysis results in conversational way"""
-            try:
-                analysis = json.loads(analysis_data) if isinstance(analysis_data, str) else analysis_data
-                
-                score = analysis.get('overall_score', 0)
-                strengths = analysis.get('strengths', [])
-                gaps = analysis.get('missing_skills', [])
-                
-                explanation = f"""
-                Based on your resume analysis:
-                
-                📊 Your overall score is {score}/100. 
-                
-                🌟 Your strengths include: {', '.join(strengths[:3])}
-                
-                🎯 Areas to focus on: {', '.join(gaps[:3])}
-                
-                This gives me a good foundation to help you plan your next steps!
-                """
-                return explanation.strip()
-            except:
+            if overall_score is None and not strengths and not missing_skills:
                 return "I can help explain your resume analysis once it's completed."
-        
-        def suggest_learning_path_tool(user_goal: str, current_skills: str = "", timeline: str = "") -> str:
-            """Suggest personalized learning paths based on user goals"""
             
-            prompt = f"""
-            As a career coach, suggest a personalized learning path for someone who wants to: {user_goal}
+            explanation = f"""
+            Based on your resume analysis:
             
-            Their current skills: {current_skills}
-            Their timeline: {timeline}
+            📊 Your overall score is {overall_score or 0}/100. 
             
-            Provide:
-            1. Immediate next steps (this week)
-            2. Short-term goals (1-3 months) 
-            3. Long-term vision (6-12 months)
-            4. Specific actionable advice
+            🌟 Your strengths include: {', '.join((strengths or [])[:3])}
             
-            Be encouraging and realistic.
-            """
-            
-            response = self.llm.invoke(prompt)
-            return response.content
-        
-        def motivational_coaching_tool(user_concern: str, progress_data: str = "") -> str:
-            """Provide motivational coaching and address concerns"""
-            
-            prompt = f"""
-            As an encouraging career coach, address this concern: {user_concern}
-            
-            Progress context: {progress_data}
+            🎯 Areas to focus on: {', '.join((missing_skills or [])[:3])}
             
-            Provide:
-            1. Acknowledgment of their concern
-            2. Realistic perspective
-            3. Actionable next steps
-            4. Motivational encouragement
-            
-            Be empathetic, practical, and inspiring.
+            This gives me a good foundation to help you plan your next steps!
             """
-            
-            response = self.llm.invoke(prompt)
-            return response.content
+            return explanation.strip()
         
-        def career_transition_advice_tool(current_role: str, target_role: str, experience_level: str = "") -> str:
-            """Provide specific advice for career transitions"""
-            
-            prompt = f"""
-            Help someone transition from {current_role} to {target_role}.
-            Experience level: {experience_level}
-            
-            Provide:
-            1. Key skills to develop
-            2. Common transition challenges
-            3. Timeline expectations
-            4. Networking strategies
-            5. Portfolio/project recommendations
-            
-            Be specific and actionable.
-            """
-            
-            response = self.llm.invoke(prompt)
-            return response.content
+        def suggest_learning_path_prompt(user_goal: str, current_skills: str = "", timeline: str = "") -> str:
+            """Prompt for a personalized learning path based on user goals"""
+            return SUGGEST_LEARNING_PATH_TMPL.substitute(user_goal=user_goal, current_skills=current_skills, timeline=timeline)
         
-        def interview_prep_coaching_tool(role: str, experience_level: str, specific_concerns: str = "") -> str:
-            """Provide interview preparation coaching"""
-            
-            prompt = f"""
-            Help prepare for {role} interviews.
-            Experience level: {experience_level}
-            Specific concerns: {specific_concerns}
-            
-            Provide:
-            1. Common interview questions for this role
-            2. How to present experience effectively
-            3. Technical preparation tips
-            4. Confidence-building strategies
-            5. Questions to ask the interviewer
-            
-            Be practical and confidence-building.
-            """
-            
-            response = self.llm.invoke(prompt)
-            return response.content
+        def motivational_coaching_prompt(user_concern: str, progress_data: str = "") -> str:
+            """Prompt for motivational coaching that addresses a concern"""
+            return MOTIVATIONAL_COACHING_TMPL.substitute(user_concern=user_concern, progress_data=progress_data)
+        
+        def career_transition_advice_prompt(current_role: str, target_role: str, experience_level: str = "") -> str:
+            """Prompt for specific career transition advice"""
+            return CAREER_TRANSITION_TMPL.substitute(current_role=current_role, target_role=target_role, experience_level=experience_level)
+        
+        def interview_prep_coaching_prompt(role: str, experience_level: str, specific_concerns: str = "") -> str:
+            """Prompt for interview preparation coaching"""
+            return INTERVIEW_PREP_TMPL.substitute(role=role, experience_level=experience_level, specific_concerns=specific_concerns)
+        
+        def llm_tool(name, build_prompt, description):
+            func, coroutine = self._llm_tool(build_prompt)
+            return lc.StructuredTool.from_function(
+                func=func,
+                coroutine=coroutine,
+                name=name,
+                description=description
+            )
         
         return [
-            Tool(
-                name="explain_analysis",
+            lc.StructuredTool.from_function(
                 func=explain_analysis_tool,
-                description="Explain resume analysis results in a conversational, easy-to-understand way"
+                name="explain_analysis",
+                description=(
+                    "Explain resume analysis results in a conversational, easy-to-understand way. "
+                    "Pass the overall_score, strengths and missing_skills from the user context."
+                )
             ),
-            Tool(
-                name="suggest_learning_path", 
-                func=suggest_learning_path_tool,
-                description="Create personalized learning paths based on user goals and timeline"
+            llm_tool(
+                "suggest_learning_path",
+                suggest_learning_path_prompt,
+                "Create personalized learning paths based on user goals and timeline"
             ),
-            Tool(
-                name="motivational_coaching",
-                func=motivational_coaching_tool,
-                description="Provide encouragement and address user concerns about their career journey"
+            llm_tool(
+                "motivational_coaching",
+                motivational_coaching_prompt,
+                "Provide encouragement and address user concerns about their career journey"
             ),
-            Tool(
-                name="career_transition_advice",
-                func=career_transition_advice_tool,
-                description="Give specific advice for transitioning between different roles"
+            llm_tool(
+                "career_transition_advice",
+                career_transition_advice_prompt,
+                "Give specific advice for transitioning between different roles"
             ),
-            Tool(
-                name="interview_prep_coaching",
-                func=interview_prep_coaching_tool,
-                description="Help users prepare for job interviews with role-specific guidance"
+            llm_tool(
+                "interview_prep_coaching",
+                interview_prep_coaching_prompt,
+                "Help users prepare for job interviews with role-specific guidance"
             )
         ]
     
     def _create_agent_prompt(self):
         """Create the agent prompt template"""
+        lc = _load_backend()
         
-        system_message = """
-        You are Euron, an expert AI Career Coach with years of experience helping people advance their careers.
-        
-        Your personality:
-        - Encouraging and supportive, but realistic
-        - Expert in technology careers (AI, software development, data, cloud)
-        - Great at breaking down complex career paths into actionable steps
-        - Always provide specific, practical advice
-        - Remember context from previous conversations
-        
-        Your approach:
-        1. Listen carefully to understand the user's situation
-        2. Use available tools to provide detailed, personalized advice
-        3. Always be encouraging while being honest about challenges
-        4. Provide specific next steps, not just general advice
-        5. Reference their resume analysis when relevant
-        
-        Available tools help you:
-        - Explain resume analysis results clearly
-        - Create personalized learning paths
-        - Provide motivational coaching
-        - Give career transition advice
-        - Help with interview preparation
-        
-        Always end responses with a question to keep the conversation going and show you care about their progress.
-        """
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_message),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad")
+        prompt = lc.ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_MESSAGE),
+            lc.MessagesPlaceholder(variable_name="chat_history"),
+            # User-supplied context is data, not instructions, so it rides in
+            # the human turn after the history rather than as a system message
+            ("human", "User context (resume analysis, learning plan, profile) as JSON: {context}\n\n{input}"),
+            lc.MessagesPlaceholder(variable_name="agent_scratchpad")
         ])
         
         return prompt
     
     def _create_agent(self):
         """Create the conversational agent"""
+        lc = _load_backend()
         tools = self._create_tools()
         prompt = self._create_agent_prompt()
         
-        agent = create_openai_functions_agent(
-            llm=self.llm,
+        # The tools agent can request several tools in one step; under
+        # ainvoke the executor runs those calls concurrently
+        agent = lc.create_openai_tools_agent(
+            llm=self.llm.with_config(tags=[AGENT_LLM_TAG]),
             tools=tools,
             prompt=prompt
         )
         
-        agent_executor = AgentExecutor(
+        agent_executor = lc.AgentExecutor(
             agent=agent,
             tools=tools,
             memory=self.memory,
-            verbose=False,  # Set to True for debugging
             handle_parsing_errors=True,
-            max_iterations=3  # Prevent infinite loops
+            return_intermediate_steps=False,
+            # One round of (possibly parallel) tool calls plus the answer; a
+            # direct answer already ends the run after the first LLM call
+            max_iterations=2,
+            max_execution_time=30
         )
         
         return agent_executor
     
+    def _quick_reply(self, user_message):
+        """
+        Return a canned reply for greetings and other small talk, or None.
+        The exchange is still recorded in memory so the agent sees it later.
+        """
+        normalized = user_message.strip().lower()
+        reply = QUICK_REPLIES.get(normalized)
+        if reply is None:
+            match = _SMALL_TALK_RE.match(normalized)
+            if not match:
+                return None
+            reply = QUICK_REPLIES[match.group(1)]
+        
+        self.memory.save_context({"input": user_message}, {"output": reply})
+        return reply
+    
+    def _serialize_context(self, context):
+        """
+        Compact JSON for the context. Chat turns in a session usually pass
+        the same context object, so its serialization is reused until a
+        different object is passed (update contexts by replacing them,
+        not by mutating them in place).
+        """
+        cached_context, serialized = self._context_cache
+        if context is not cached_context:
+            serialized = json.dumps(context, separators=(',', ':'), ensure_ascii=False)
+            self._context_cache = (context, serialized)
+        return serialized
+    
+    def _build_inputs(self, user_message, context=None):
+        """
+        Agent inputs for a chat turn. Context goes to its own prompt slot
+        instead of being pasted into the user message, so it is not copied
+        into the conversation memory on every turn.
+        """
+        return {
+            "input": user_message,
+            "context": self._serialize_context(context) if context else "none"
+        }
+    
     def chat(self, user_message, context=None):
         """
         Main chat interface
@@ -237,24 +388,63 @@ class ConversationalCareerCoach:
             Agent's response
         """
         try:
-            # Add context to the message if provided
-            enhanced_message = user_message
-            if context:
-                enhanced_message = f"""
-                Context: {json.dumps(context, indent=2)}
-                
-                User message: {user_message}
-                """
+            quick_reply = self._quick_reply(user_message)
+            if quick_reply is not None:
+                return quick_reply
             
-            response = self.agent_executor.invoke({
-                "input": enhanced_message
-            })
+            response = self.agent_executor.invoke(self._build_inputs(user_message, context))
             
             return response["output"]
             
         except Exception as e:
             return f"I apologize, but I encountered an issue: {str(e)}. Could you please rephrase your question?"
     
+    async def achat(self, user_message, context=None):
+        """
+        Async chat interface. Tool calls requested together by the agent
+        run concurrently instead of one after another.
+        """
+        try:
+            quick_reply = self._quick_reply(user_message)
+            if quick_reply is not None:
+                return quick_reply
+            
+            response = await self.agent_executor.ainvoke(self._build_inputs(user_message, context))
+            
+            return response["output"]
+            
+        except Exception as e:
+            return f"I apologize, but I encountered an issue: {str(e)}. Could you please rephrase your question?"
+    
+    async def astream_chat(self, user_message, context=None):
+        """
+        Stream the agent's reply as it is generated
+        
+        Yields text chunks of the final answer, so callers can render the
+        start of the reply without waiting for the whole completion.
+        Tool-internal LLM output is not streamed.
+        """
+        try:
+            quick_reply = self._quick_reply(user_message)
+            if quick_reply is not None:
+                yield quick_reply
+                return
+            
+            async for event in self.agent_executor.astream_events(
+                self._build_inputs(user_message, context),
+                version="v2"
+            ):
+                if event["event"] != "on_chat_model_stream" or AGENT_LLM_TAG not in event.get("tags", []):
+                    continue
+                
+                # Tool-call chunks carry no content
+                content = event["data"]["chunk"].content
+                if content:
+                    yield content
+                    
+        except Exception as e:
+            yield f"I apologize, but I encountered an issue: {str(e)}. Could you please rephrase your question?"
+    
     def get_conversation_summary(self):
         """Get a summary of the current conversation"""
         try:
@@ -263,20 +453,9 @@ class ConversationalCareerCoach:
                 return "No conversation history yet."
             
             # Get last few messages for summary
-            recent_messages = messages[-6:] if len(messages) > 6 else messages
-            
-            summary_prompt = """
-            Summarize this career coaching conversation:
-            
-            """ + "\n".join([f"{msg.type}: {msg.content}" for msg in recent_messages]) + """
+            transcript = "\n".join(f"{msg.type}: {msg.content}" for msg in messages[-6:])
             
-            Provide a brief summary of:
-            1. Main topics discussed
-            2. Key advice given
-            3. User's goals/concerns
-            """
-            
-            response = self.llm.invoke(summary_prompt)
+            response = self.llm.invoke(self._summary_template.format_messages(transcript=transcript))
             return response.content
             
         except Exception as e:
@@ -288,6 +467,7 @@ class ConversationalCareerCoach:
     
     def suggest_follow_up_questions(self, last_response):
         """Suggest follow-up questions based on the conversation"""
+        lc = _load_backend()
         
         prompt = f"""
         Based on this career coaching response: "{last_response}"
@@ -301,7 +481,9 @@ class ConversationalCareerCoach:
         try:
             response = self.llm.invoke(prompt)
             return response.content
-        except:
+        except lc.openai.APIError:
+            # Timeouts and connection errors are APIError subclasses; the
+            # client has already retried them (max_retries) by this point
             return """
             Here are some questions you might want to ask:
             • What should I focus on first?
@@ -327,15 +509,20 @@ def format_context_for_agent(analysis_result=None, learning_plan=None, user_prof
         }
     
     if learning_plan:
+        # First 5 courses; plain rows are read into LearningPlanItem fields
+        plans = (
+            plan if isinstance(plan, LearningPlanItem) else LearningPlanItem._make(plan[:6])
+            for plan in learning_plan[:5]
+        )
         context["learning_plan"] = [
             {
-                "skill": plan[0],
-                "current_level": plan[1], 
-                "target_level": plan[2],
-                "course": plan[3],
-                "duration": plan[5]
+                "skill": plan.skill,
+                "current_level": plan.current,
+                "target_level": plan.target,
+                "course": plan.course,
+                "duration": plan.duration
             }
-            for plan in learning_plan[:5]  # First 5 courses
+            for plan in plans
         ]
     
     if user_profile:
@@ -0,0 +1,43 @@
+"""
+Shared SQLite connection for the career coach database
+"""
+
+import sqlite3
+import threading
+
+DB_PATH = 'career_coach.db'
+
+_local = threading.local()
+
+def get_conn():
+    """
+    Return this thread's connection to the career coach database, opening it
+    on first use. Streamlit runs each script run on its own thread, so a
+    page reuses one connection for all its queries while concurrent sessions
+    never share one. Writers still commit explicitly.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        
+        # Page size can only be chosen before the first table is written
+        # (and not at all once in WAL mode), so only for a fresh database
+        if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+            conn.execute('PRAGMA page_size=8192')
+        
+        # WAL lets readers run while the bulk analysis writes; NORMAL syncs
+        # only at checkpoints, which is safe in WAL mode
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-20000')  # 20 MiB per connection
+        conn.execute('PRAGMA mmap_size=268435456')
+        _local.conn = conn
+    return conn
+
+def table_sql(conn, table):
+    """Return the CREATE TABLE statement stored for a table, or None if it doesn't exist"""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row[0] if row else None
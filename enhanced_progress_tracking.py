@@ -3,30 +3,85 @@ Enhanced Progress Tracking System
 Adds automatic tracking, detailed metrics, and better user experience
 """
 
-import sqlite3
 import streamlit as st
 from datetime import datetime, timedelta
 import json
+import html
+from db import get_conn, table_sql
+
+# Progress rows are looked up by (user, skill, course), so that key is the
+# primary key of an index-organized table. Skill-level rows use '' as course.
+DETAILED_PROGRESS_COLUMNS = '''
+    user_id INTEGER,
+    skill_name TEXT,
+    course_name TEXT,
+    progress_percentage INTEGER NOT NULL DEFAULT 0,
+    time_spent_minutes INTEGER NOT NULL DEFAULT 0,
+    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completion_date TIMESTAMP,
+    notes TEXT,
+    PRIMARY KEY (user_id, skill_name, course_name),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+'''
+
+def migrate_detailed_progress(conn):
+    """
+    Rebuild a detailed_progress table from the old rowid layout, or one whose
+    progress/time columns still allow NULL. Rows are copied oldest first, so
+    the newest row supplies each key's columns and duplicates left by the old
+    INSERT OR REPLACE collapse into one; skill-level time is then re-summed
+    from learning_sessions.
+    """
+    sql = table_sql(conn, 'detailed_progress')
+    if sql is None:
+        return
+    
+    cursor = conn.cursor()
+    columns = {row[1]: row[3] for row in cursor.execute('PRAGMA table_info(detailed_progress)')}
+    if ('WITHOUT ROWID' in sql.upper() and columns['progress_percentage']
+            and columns['time_spent_minutes']):
+        return
+    
+    order_by = 'ORDER BY id' if 'id' in columns else ''
+    
+    cursor.execute('BEGIN')
+    cursor.execute('DROP TABLE IF EXISTS detailed_progress_new')
+    cursor.execute(f'CREATE TABLE detailed_progress_new ({DETAILED_PROGRESS_COLUMNS}) WITHOUT ROWID')
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO detailed_progress_new
+        (user_id, skill_name, course_name, progress_percentage, time_spent_minutes,
+         last_activity, completion_date, notes)
+        SELECT user_id, skill_name, COALESCE(course_name, ''), COALESCE(progress_percentage, 0),
+               COALESCE(time_spent_minutes, 0), last_activity, completion_date, notes
+        FROM detailed_progress
+        WHERE user_id IS NOT NULL AND skill_name IS NOT NULL
+        {order_by}
+    ''')
+    
+    # The old correlated-subquery insert summed against the oldest duplicate,
+    # so stored skill-level totals can't be trusted; rebuild them from the
+    # sessions they were meant to add up
+    cursor.execute('''
+        UPDATE detailed_progress_new
+        SET time_spent_minutes = COALESCE((
+            SELECT SUM(minutes_studied) FROM learning_sessions
+            WHERE learning_sessions.user_id = detailed_progress_new.user_id
+              AND learning_sessions.skill_name = detailed_progress_new.skill_name
+        ), 0)
+        WHERE course_name = ''
+    ''')
+    cursor.execute('DROP TABLE detailed_progress')
+    cursor.execute('ALTER TABLE detailed_progress_new RENAME TO detailed_progress')
+    conn.commit()
 
 def update_learning_progress_database():
     """Add enhanced progress tracking tables"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     
     # Enhanced progress tracking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS detailed_progress (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            skill_name TEXT,
-            course_name TEXT,
-            progress_percentage INTEGER DEFAULT 0,
-            time_spent_minutes INTEGER DEFAULT 0,
-            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completion_date TIMESTAMP,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS detailed_progress ({DETAILED_PROGRESS_COLUMNS}) WITHOUT ROWID
     ''')
     
     # Learning sessions table for time tracking
@@ -43,6 +98,23 @@ def update_learning_progress_database():
         )
     ''')
     
+    # Rebuilding recomputes skill-level time from learning_sessions
+    migrate_detailed_progress(conn)
+    
+    # Append-only history of time and progress updates; detailed_progress
+    # holds only the latest state per course
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS progress_events (
+            user_id INTEGER,
+            skill_name TEXT,
+            course_name TEXT,
+            ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delta_minutes INTEGER,
+            pct INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
     # Achievements table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS achievements (
@@ -56,12 +128,48 @@ def update_learning_progress_database():
         )
     ''')
     
+    # Covers get_detailed_progress: rows come back in order, without a sort
+    # step or a table lookup
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_dp_user_activity
+        ON detailed_progress (user_id, last_activity DESC, skill_name, course_name,
+                              progress_percentage, time_spent_minutes, completion_date, notes)
+    ''')
+    # Matches the user/date filter of get_learning_sessions
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ls_user_date
+        ON learning_sessions (user_id, session_date DESC)
+    ''')
+    # Time-range reads over a user's progress history
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pe_user_ts
+        ON progress_events (user_id, ts DESC)
+    ''')
+    
+    # One achievement of each name per user. Concurrent awards under the old
+    # check-then-insert could duplicate rows; keep the earliest of each
+    cursor.execute('''
+        SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_ach_unique'
+    ''')
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            DELETE FROM achievements
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM achievements
+                GROUP BY user_id, achievement_type, achievement_name
+            )
+        ''')
+        cursor.execute('DROP INDEX IF EXISTS idx_ach_user_type_name')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ach_unique
+        ON achievements (user_id, achievement_type, achievement_name)
+    ''')
+    
     conn.commit()
-    conn.close()
 
 def log_learning_session(user_id, skill_name, minutes_studied, notes=""):
     """Log a learning session"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -69,32 +177,57 @@ def log_learning_session(user_id, skill_name, minutes_studied, notes=""):
         VALUES (?, ?, DATE('now'), ?, ?)
     ''', (user_id, skill_name, minutes_studied, notes))
     
-    # Update detailed progress
     cursor.execute('''
-        INSERT OR REPLACE INTO detailed_progress 
-        (user_id, skill_name, time_spent_minutes, last_activity)
-        VALUES (?, ?, 
-            COALESCE((SELECT time_spent_minutes FROM detailed_progress 
-                     WHERE user_id = ? AND skill_name = ?), 0) + ?,
-            CURRENT_TIMESTAMP)
-    ''', (user_id, skill_name, user_id, skill_name, minutes_studied))
+        INSERT INTO progress_events (user_id, skill_name, course_name, delta_minutes)
+        VALUES (?, ?, '', ?)
+    ''', (user_id, skill_name, minutes_studied))
+    
+    # Add the time to the skill-level progress row
+    cursor.execute('''
+        INSERT INTO detailed_progress 
+        (user_id, skill_name, course_name, time_spent_minutes, last_activity)
+        VALUES (?, ?, '', ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id, skill_name, course_name) DO UPDATE SET
+            time_spent_minutes = time_spent_minutes + excluded.time_spent_minutes,
+            last_activity = CURRENT_TIMESTAMP
+    ''', (user_id, skill_name, minutes_studied))
     
     conn.commit()
-    conn.close()
+    
+    # Let the cached readers see the new session
+    get_detailed_progress.clear()
+    get_learning_sessions.clear()
+    get_daily_study.clear()
+    st.session_state.pop('user_skills', None)
 
 def update_course_progress(user_id, skill_name, course_name, progress_percentage, notes=""):
     """Update progress for a specific course"""
-    conn = sqlite3.connect('career_coach.db')
+    # '' is the course_name of the skill-level row that holds logged time
+    if not course_name.strip():
+        raise ValueError("course_name is required")
+    
+    conn = get_conn()
     cursor = conn.cursor()
     
-    # Update detailed progress
+    # Update detailed progress, keeping time already logged for the course
     cursor.execute('''
-        INSERT OR REPLACE INTO detailed_progress 
+        INSERT INTO detailed_progress 
         (user_id, skill_name, course_name, progress_percentage, last_activity, notes)
         VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+        ON CONFLICT (user_id, skill_name, course_name) DO UPDATE SET
+            progress_percentage = excluded.progress_percentage,
+            notes = excluded.notes,
+            last_activity = CURRENT_TIMESTAMP,
+            completion_date = CASE WHEN excluded.progress_percentage >= 100 THEN completion_date END
     ''', (user_id, skill_name, course_name, progress_percentage, notes))
     
+    cursor.execute('''
+        INSERT INTO progress_events (user_id, skill_name, course_name, pct)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, skill_name, course_name, progress_percentage))
+    
     # Update learning plan status based on progress
+    awarded = False
     if progress_percentage >= 100:
         status = 'completed'
         # Log completion date
@@ -105,7 +238,7 @@ def update_course_progress(user_id, skill_name, course_name, progress_percentage
         ''', (user_id, skill_name, course_name))
         
         # Check for achievements
-        check_and_award_achievements(user_id, skill_name)
+        awarded = check_and_award_achievements(user_id, skill_name)
         
     elif progress_percentage > 0:
         status = 'in_progress'
@@ -120,37 +253,39 @@ def update_course_progress(user_id, skill_name, course_name, progress_percentage
     ''', (status, user_id, skill_name))
     
     conn.commit()
-    conn.close()
+    
+    get_detailed_progress.clear()
+    st.session_state.pop('user_skills', None)
+    if awarded:
+        get_achievements.clear()
+        get_achievements_html.clear()
 
 def check_and_award_achievements(user_id, skill_name):
-    """Check and award achievements"""
-    conn = sqlite3.connect('career_coach.db')
+    """
+    Check and award achievements. Runs inside the caller's transaction on the
+    shared connection, so the caller commits; returns whether one was awarded.
+    """
+    conn = get_conn()
     cursor = conn.cursor()
     
-    # Check if achievement already exists
+    # Award the achievement unless the user already has it
     cursor.execute('''
-        SELECT COUNT(*) FROM achievements 
-        WHERE user_id = ? AND achievement_type = 'course_completion' AND achievement_name = ?
-    ''', (user_id, f"Completed {skill_name}"))
-    
-    if cursor.fetchone()[0] == 0:
-        # Award achievement
-        cursor.execute('''
-            INSERT INTO achievements (user_id, achievement_type, achievement_name, description)
-            VALUES (?, 'course_completion', ?, ?)
-        ''', (user_id, f"Completed {skill_name}", f"Successfully completed {skill_name} course"))
-        
-        conn.commit()
+        INSERT INTO achievements (user_id, achievement_type, achievement_name, description)
+        VALUES (?, 'course_completion', ?, ?)
+        ON CONFLICT (user_id, achievement_type, achievement_name) DO NOTHING
+    ''', (user_id, f"Completed {skill_name}", f"Successfully completed {skill_name} course"))
     
-    conn.close()
+    return cursor.rowcount > 0
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_detailed_progress(user_id):
     """Get detailed progress for a user"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT skill_name, course_name, progress_percentage, time_spent_minutes, 
+        SELECT skill_name, course_name, progress_percentage,
+               time_spent_minutes / 60 AS hrs, time_spent_minutes % 60 AS mins,
                last_activity, completion_date, notes
         FROM detailed_progress 
         WHERE user_id = ?
@@ -158,28 +293,46 @@ def get_detailed_progress(user_id):
     ''', (user_id,))
     
     progress = cursor.fetchall()
-    conn.close()
     return progress
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_learning_sessions(user_id, days_back=30):
     """Get learning sessions for the last N days"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT skill_name, session_date, minutes_studied, notes
+        SELECT skill_name, session_date,
+               minutes_studied / 60 AS hrs, minutes_studied % 60 AS mins, notes
         FROM learning_sessions 
-        WHERE user_id = ? AND session_date >= DATE('now', '-{} days')
+        WHERE user_id = ? AND session_date >= DATE('now', ?)
         ORDER BY session_date DESC
-    '''.format(days_back), (user_id,))
+    ''', (user_id, f'-{int(days_back)} days'))
     
     sessions = cursor.fetchall()
-    conn.close()
     return sessions
 
+@st.cache_data(ttl=60, show_spinner=False)
+def get_daily_study(user_id, days_back=30):
+    """Get total hours studied per day for the last N days"""
+    conn = get_conn()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT session_date, SUM(minutes_studied) / 60.0 AS hours
+        FROM learning_sessions 
+        WHERE user_id = ? AND session_date >= DATE('now', ?)
+        GROUP BY session_date
+        ORDER BY session_date
+    ''', (user_id, f'-{int(days_back)} days'))
+    
+    daily_study = cursor.fetchall()
+    return daily_study
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_achievements(user_id):
     """Get user achievements"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -190,9 +343,37 @@ def get_achievements(user_id):
     ''', (user_id,))
     
     achievements = cursor.fetchall()
-    conn.close()
     return achievements
 
+def get_latest_achievement_date(user_id):
+    """Get when the user last earned an achievement, or None if they have none"""
+    conn = get_conn()
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(earned_date) FROM achievements WHERE user_id = ?', (user_id,))
+    return cursor.fetchone()[0]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_achievements_html(user_id, latest_earned_date):
+    """Render all of a user's achievements as one HTML block; a new award changes the key"""
+    cards = []
+    for achievement_type, name, description, earned_date in get_achievements(user_id):
+        cards.append(f"""
+        <div style="background-color: #1f4e79; padding: 15px; border-radius: 10px; margin: 10px 0;">
+            <h4>🏆 {html.escape(name)}</h4>
+            <p>{html.escape(description or '')}</p>
+            <small>Earned on: {html.escape(str(earned_date))}</small>
+        </div>
+        """)
+    return ''.join(cards)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_plan_skills(user_id):
+    """Get the skills in a user's learning plan"""
+    conn = get_conn()
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT skill_name FROM learning_plans WHERE user_id = ?', (user_id,))
+    return [row[0] for row in cursor.fetchall()]
+
 def enhanced_progress_tracking_page(user_id):
     """Enhanced progress tracking page with detailed metrics"""
     
@@ -201,10 +382,16 @@ def enhanced_progress_tracking_page(user_id):
     # Initialize enhanced database
     update_learning_progress_database()
     
+    # Plan skills for the Log Session forms, kept per user for the session.
+    # An empty list is refetched, since learning plans are created elsewhere
+    if not st.session_state.get('user_skills') or st.session_state.get('_skills_uid') != user_id:
+        st.session_state.user_skills = get_plan_skills(user_id)
+        st.session_state._skills_uid = user_id
+    
     # Get data
     detailed_progress = get_detailed_progress(user_id)
     learning_sessions = get_learning_sessions(user_id)
-    achievements = get_achievements(user_id)
+    latest_achievement = get_latest_achievement_date(user_id)
     
     # Tabs for different views
     tab1, tab2, tab3, tab4 = st.tabs(["📈 Overview", "⏱️ Time Tracking", "🏆 Achievements", "📝 Log Session"])
@@ -215,7 +402,7 @@ def enhanced_progress_tracking_page(user_id):
         if detailed_progress:
             # Create progress cards
             for progress in detailed_progress:
-                skill, course, percentage, time_spent, last_activity, completion_date, notes = progress
+                skill, course, percentage, hours, minutes, last_activity, completion_date, notes = progress
                 
                 with st.container():
                     col1, col2, col3 = st.columns([2, 1, 1])
@@ -224,12 +411,10 @@ def enhanced_progress_tracking_page(user_id):
                         st.markdown(f"**{skill}**")
                         if course:
                             st.markdown(f"*{course}*")
-                        st.progress(percentage / 100 if percentage else 0)
+                        st.progress(percentage / 100)
                         st.markdown(f"{percentage}% Complete")
                     
                     with col2:
-                        hours = time_spent // 60 if time_spent else 0
-                        minutes = time_spent % 60 if time_spent else 0
                         st.metric("Time Spent", f"{hours}h {minutes}m")
                     
                     with col3:
@@ -254,20 +439,15 @@ def enhanced_progress_tracking_page(user_id):
             # Create a chart of daily study time
             import pandas as pd
             
-            df = pd.DataFrame(learning_sessions, columns=['Skill', 'Date', 'Minutes', 'Notes'])
-            df['Hours'] = df['Minutes'] / 60
-            
-            # Group by date
-            daily_study = df.groupby('Date')['Hours'].sum().reset_index()
+            # Daily totals are summed in SQL
+            daily_study = pd.DataFrame(get_daily_study(user_id), columns=['Date', 'Hours'])
             
             st.line_chart(daily_study.set_index('Date'))
             
             # Show recent sessions
             st.markdown("#### Recent Sessions")
             for session in learning_sessions[:10]:
-                skill, date, minutes, notes = session
-                hours = minutes // 60
-                mins = minutes % 60
+                skill, date, hours, mins, notes = session
                 
                 st.markdown(f"""
                 **{skill}** - {date}  
@@ -281,17 +461,8 @@ def enhanced_progress_tracking_page(user_id):
     with tab3:
         st.markdown("### 🏆 Achievements")
         
-        if achievements:
-            for achievement in achievements:
-                achievement_type, name, description, earned_date = achievement
-                
-                st.markdown(f"""
-                <div style="background-color: #1f4e79; padding: 15px; border-radius: 10px; margin: 10px 0;">
-                    <h4>🏆 {name}</h4>
-                    <p>{description}</p>
-                    <small>Earned on: {earned_date}</small>
-                </div>
-                """, unsafe_allow_html=True)
+        if latest_achievement:
+            st.markdown(get_achievements_html(user_id, latest_achievement), unsafe_allow_html=True)
         else:
             st.info("No achievements yet. Complete your first course to earn your first achievement!")
     
@@ -299,11 +470,7 @@ def enhanced_progress_tracking_page(user_id):
         st.markdown("### 📝 Log Learning Session")
         
         # Get user's learning plan for skill selection
-        conn = sqlite3.connect('career_coach.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT skill_name FROM learning_plans WHERE user_id = ?', (user_id,))
-        skills = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        skills = st.session_state.user_skills
         
         if skills:
             with st.form("log_session_form"):
@@ -341,9 +508,12 @@ def enhanced_progress_tracking_page(user_id):
                 submitted = st.form_submit_button("Update Progress")
                 
                 if submitted:
-                    update_course_progress(user_id, skill, course_name, progress, notes)
-                    st.success(f"✅ Updated {skill} progress to {progress}%!")
-                    st.rerun()
+                    if not course_name.strip():
+                        st.error("Please enter a course name")
+                    else:
+                        update_course_progress(user_id, skill, course_name, progress, notes)
+                        st.success(f"✅ Updated {skill} progress to {progress}%!")
+                        st.rerun()
 
 # Integration function for the main app
 def integrate_enhanced_progress_tracking():
@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the Flask app (app.py)
+Run with: gunicorn app:app
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Bedrock agent calls spend seconds waiting on network I/O. gevent workers
+# monkey-patch sockets before the app (and boto3) is imported, so each worker
+# can hold hundreds of in-flight calls instead of blocking one per request.
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 500))
+
+# Leave room for slow agent responses (botocore read_timeout is 60s)
+timeout = 90
+keepalive = 5
+
+def post_worker_init(worker):
+    """Warm the Bedrock integration and cache model once per worker, before it takes traffic"""
+    from app import get_bedrock, semantic_cache
+
+    try:
+        get_bedrock()
+    except Exception as e:
+        # Leave it to the first request rather than failing the worker boot
+        worker.log.warning("Bedrock warm-up failed: %s", e)
+
+    # Loading the model blocks the worker's event loop, so do it before
+    # any request greenlet is running
+    if semantic_cache is not None:
+        try:
+            semantic_cache.load()
+        except Exception as e:
+            worker.log.warning("Semantic cache model load failed: %s", e)
@@ -0,0 +1,131 @@
+"""
+Response caching for Bedrock agent calls
+Lets repeated questions skip the agent round-trip entirely
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from cachetools import TTLCache
+
+def make_cache_key(endpoint, **inputs):
+    """SHA256 over the endpoint name and its inputs, independent of key order"""
+    payload = json.dumps({'ep': endpoint, **inputs}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def normalize_message(message):
+    """Lower-case and collapse whitespace so trivial variations share an entry"""
+    return ' '.join(message.lower().split())
+
+class ExactCache:
+    """Thread-safe TTL cache for responses to byte-identical requests"""
+
+    def __init__(self, maxsize=10_000, ttl=3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key, value):
+        """Store a value under key"""
+        with self._lock:
+            self._cache[key] = value
+
+class SemanticCache:
+    """
+    Cache agent responses by meaning rather than by exact text.
+
+    Messages are embedded with a small sentence-transformers model and kept in
+    one FAISS inner-product index per scope. A new message whose cosine
+    similarity to a cached one reaches the threshold reuses that response.
+    Agent replies depend on the conversation, so callers scope entries to a
+    session and skip messages too short to stand on their own ("yes",
+    "tell me more").
+    """
+
+    def __init__(self, model_name='sentence-transformers/all-MiniLM-L6-v2',
+                 threshold=0.92, ttl=3600, max_entries=1000, min_words=4):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_words = min_words
+        self._model = None
+        self._indexes = {}  # scope -> faiss index
+        self._entries = OrderedDict()  # vector id -> (scope, response, expires_at)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def cacheable(self, message):
+        """Whether a message carries enough meaning on its own to share a response"""
+        return len(message.split()) >= self.min_words
+
+    def load(self):
+        """Load the embedding model; call at worker start to keep it off the request path"""
+        if self._model is None:
+            # Heavy import, only paid for when caching is enabled
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+
+    def embed(self, message):
+        """Return the normalized embedding of a message as a (1, dim) float32 array"""
+        self.load()
+        vector = self._model.encode([normalize_message(message)], normalize_embeddings=True)
+        return vector.astype('float32')
+
+    def get(self, scope, embedding):
+        """Return the cached response in scope closest to the embedding, or None"""
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None or index.ntotal == 0:
+                return None
+
+            scores, ids = index.search(embedding, 1)
+            entry_id = int(ids[0][0])
+            if entry_id == -1 or scores[0][0] < self.threshold:
+                return None
+
+            _, response, expires_at = self._entries[entry_id]
+            if expires_at < time.monotonic():
+                self._remove(entry_id)
+                return None
+
+            self._entries.move_to_end(entry_id)
+            return response
+
+    def put(self, scope, embedding, response):
+        """Store a response in scope under the embedding of the message that produced it"""
+        import faiss
+        import numpy as np
+
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                index = faiss.IndexIDMap(faiss.IndexFlatIP(embedding.shape[1]))
+                self._indexes[scope] = index
+
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(embedding, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = (scope, response, time.monotonic() + self.ttl)
+
+            # Evict least recently used entries beyond the size limit
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        """Drop an entry from both the index and the response store"""
+        import numpy as np
+
+        scope, _, _ = self._entries.pop(entry_id)
+        index = self._indexes[scope]
+        index.remove_ids(np.array([entry_id], dtype='int64'))
+
+        # Scopes are per session, so don't keep their empty indexes around
+        if index.ntotal == 0:
+            del self._indexes[scope]
@@ -4,26 +4,61 @@ Basic bulk upload and analysis functionality
 """
 
 import streamlit as st
-import sqlite3
-import tempfile
-import os
 from datetime import datetime
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
 from agents import ResumeAnalysisAgent
+from db import get_conn, table_sql
+
+# Resume analysis mostly waits on the OpenAI API, so several run at once
+MAX_ANALYSIS_WORKERS = 8
+
+# Attempts per resume when OpenAI rate-limits or drops the connection.
+# This stacks on the SDK's own two retries inside ResumeAnalysisAgent, whose
+# client is built outside this module: those ride out a single 429 within
+# one request, while this outer loop re-runs the whole analysis once the
+# SDK gives up, so a burst of throttling across the parallel workers costs a
+# few extra calls instead of losing the resume and restarting the job
+MAX_ANALYSIS_ATTEMPTS = 3
+
+ADMIN_USERS_COLUMNS = '''
+    user_id INTEGER PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+'''
+
+def migrate_admin_users(conn):
+    """Rebuild an admin_users table from the old rowid layout, one row per user"""
+    sql = table_sql(conn, 'admin_users')
+    if sql is None or 'WITHOUT ROWID' in sql.upper():
+        return
+    
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+    cursor.execute('DROP TABLE IF EXISTS admin_users_new')
+    cursor.execute(f'CREATE TABLE admin_users_new ({ADMIN_USERS_COLUMNS}) WITHOUT ROWID')
+    cursor.execute('''
+        INSERT OR IGNORE INTO admin_users_new (user_id, created_at)
+        SELECT user_id, created_at FROM admin_users
+        WHERE user_id IS NOT NULL
+        ORDER BY id
+    ''')
+    cursor.execute('DROP TABLE admin_users')
+    cursor.execute('ALTER TABLE admin_users_new RENAME TO admin_users')
+    conn.commit()
 
 def init_admin_tables():
     """Initialize simple admin tables"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     
-    # Simple admin users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+    # Simple admin users table, keyed and stored by user_id
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS admin_users ({ADMIN_USERS_COLUMNS}) WITHOUT ROWID
     ''')
+    migrate_admin_users(conn)
     
     # Simple bulk results table
     cursor.execute('''
@@ -38,26 +73,107 @@ def init_admin_tables():
         )
     ''')
     
+    # Serves get_top_results in score order without a sort
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bulk_admin_job_score
+        ON bulk_results (admin_id, job_role, score DESC)
+    ''')
+    
     conn.commit()
-    conn.close()
 
 def make_admin(user_id):
     """Make user an admin"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     cursor.execute('INSERT OR IGNORE INTO admin_users (user_id) VALUES (?)', (user_id,))
     conn.commit()
-    conn.close()
+    is_admin.clear()
 
+@st.cache_data(ttl=60, show_spinner=False)
 def is_admin(user_id):
     """Check if user is admin"""
-    conn = sqlite3.connect('career_coach.db')
+    conn = get_conn()
     cursor = conn.cursor()
     cursor.execute('SELECT COUNT(*) FROM admin_users WHERE user_id = ?', (user_id,))
     result = cursor.fetchone()[0] > 0
-    conn.close()
     return result
 
+# ResumeAnalysisAgent isn't known to be thread-safe, so each analysis
+# thread builds its own and only ever uses it from that thread
+_worker = threading.local()
+
+def _init_analysis_worker(api_key):
+    """Create this worker thread's resume analyzer"""
+    _worker.analyzer = ResumeAnalysisAgent(api_key=api_key)
+
+@st.cache_resource(show_spinner=False)
+def _get_analysis_pool(api_key):
+    """
+    Return the analysis thread pool for an API key. The pool lives across
+    reruns, so its threads (and the analyzer each one built) are reused
+    rather than rebuilt on every click.
+    """
+    return ThreadPoolExecutor(
+        max_workers=MAX_ANALYSIS_WORKERS,
+        initializer=_init_analysis_worker,
+        initargs=(api_key,)
+    )
+
+def get_top_results(admin_id, job_role, limit=50):
+    """Get an admin's highest scoring results for a job role"""
+    conn = get_conn()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT filename, score, selected
+        FROM bulk_results
+        WHERE admin_id = ? AND job_role = ?
+        ORDER BY score DESC
+        LIMIT ?
+    ''', (admin_id, job_role, limit))
+    
+    return cursor.fetchall()
+
+def _analyze_with_retry(uploaded_file, max_attempts=MAX_ANALYSIS_ATTEMPTS):
+    """Analyze a resume on a worker thread, backing off and retrying on transient OpenAI errors"""
+    for attempt in range(max_attempts):
+        try:
+            return _worker.analyzer.analyze_resume(uploaded_file)
+        except (openai.RateLimitError, openai.APIConnectionError):
+            if attempt == max_attempts - 1:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+            uploaded_file.seek(0)
+
+def render_metrics(placeholder, total_count, matched_count):
+    """Show the running totals in the metrics placeholder"""
+    with placeholder.container():
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Total Resumes", total_count)
+        with col2:
+            st.metric("Matched Candidates", matched_count)
+        with col3:
+            match_rate = (matched_count / total_count * 100) if total_count else 0
+            st.metric("Match Rate", f"{match_rate:.1f}%")
+
+def render_result(container, filename, score, selected, strengths, missing_skills):
+    """Show one analyzed resume in the results container"""
+    status = "✅ MATCHED" if selected else "❌ NOT MATCHED"
+    
+    with container.expander(f"{status} - {filename} (Score: {score}/100)"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**Strengths:**")
+            for strength in strengths:
+                st.success(f"✅ {strength}")
+        
+        with col2:
+            st.markdown("**Missing Skills:**")
+            for skill in missing_skills:
+                st.error(f"❌ {skill}")
+
 def simple_admin_page(api_key, user_id):
     """Simple admin interface"""
     st.subheader("👨‍💼 Admin: Bulk Resume Analysis")
@@ -95,75 +211,85 @@ def simple_admin_page(api_key, user_id):
             st.error("Please enter OpenAI API key")
             return
             
-        # Initialize analyzer
-        analyzer = ResumeAnalysisAgent(api_key=api_key)
+        # Check the key once up front rather than failing on every resume
+        try:
+            openai.OpenAI(api_key=api_key, timeout=10, max_retries=0).models.list()
+        except openai.AuthenticationError:
+            st.error("Invalid OpenAI API key")
+            return
+        except openai.APIError as e:
+            st.error(f"Could not reach OpenAI: {e}")
+            return
         
         # Progress tracking
         progress_bar = st.progress(0)
-        results = []
+        metrics = st.empty()
+        total_count = 0
+        matched_count = 0
+        rows = []
         
-        # Analyze each resume
-        for i, uploaded_file in enumerate(uploaded_files):
-            progress_bar.progress((i + 1) / len(uploaded_files))
+        # Each result is shown as soon as its analysis finishes
+        st.subheader("📊 Detailed Results")
+        live_results = st.container()
+        
+        # Analyze resumes concurrently; results are collected (and saved
+        # below) on this thread so SQLite keeps a single writer
+        executor = _get_analysis_pool(api_key)
+        futures = {}
+        try:
+            for uploaded_file in uploaded_files:
+                futures[executor.submit(_analyze_with_retry, uploaded_file)] = uploaded_file
             
-            try:
-                # Analyze resume
-                analysis = analyzer.analyze_resume(uploaded_file)
-                
-                result = {
-                    'filename': uploaded_file.name,
-                    'score': analysis.get('overall_score', 0),
-                    'selected': analysis.get('selected', False),
-                    'strengths': analysis.get('strengths', []),
-                    'missing_skills': analysis.get('missing_skills', [])
-                }
-                results.append(result)
+            for i, future in enumerate(as_completed(futures), start=1):
+                uploaded_file = futures[future]
+                progress_bar.progress(i / len(uploaded_files))
                 
-                # Save to database
-                conn = sqlite3.connect('career_coach.db')
-                cursor = conn.cursor()
-                cursor.execute('''
+                try:
+                    analysis = future.result()
+                    
+                    score = analysis.get('overall_score', 0)
+                    selected = analysis.get('selected', False)
+                    rows.append((user_id, job_role, uploaded_file.name, score, selected))
+                    
+                    total_count += 1
+                    if selected:
+                        matched_count += 1
+                    
+                    render_result(
+                        live_results, uploaded_file.name, score, selected,
+                        analysis.get('strengths', []), analysis.get('missing_skills', [])
+                    )
+                    render_metrics(metrics, total_count, matched_count)
+                    
+                except Exception as e:
+                    live_results.error(f"Error analyzing {uploaded_file.name}: {e}")
+        finally:
+            # A Streamlit stop or rerun lands here mid-job: drop this run's
+            # queued resumes instead of paying for all of them. The pool
+            # itself is shared and stays up
+            for future in futures:
+                future.cancel()
+            
+            # Save what finished in one transaction (rolled back if any insert fails)
+            conn = get_conn()
+            with conn:
+                conn.executemany('''
                     INSERT INTO bulk_results (admin_id, job_role, filename, score, selected)
                     VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, job_role, uploaded_file.name, result['score'], result['selected']))
-                conn.commit()
-                conn.close()
-                
-            except Exception as e:
-                st.error(f"Error analyzing {uploaded_file.name}: {e}")
+                ''', rows)
         
-        # Display results
         st.success("✅ Analysis completed!")
         
-        matched_count = sum(1 for r in results if r['selected'])
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Resumes", len(results))
-        with col2:
-            st.metric("Matched Candidates", matched_count)
-        with col3:
-            match_rate = (matched_count / len(results) * 100) if results else 0
-            st.metric("Match Rate", f"{match_rate:.1f}%")
-        
-        # Show detailed results
-        st.subheader("📊 Detailed Results")
+        # Results above arrive in completion order; rank them on request
+        with st.expander(f"Show top matches for {job_role}"):
+            for filename, score, selected in get_top_results(user_id, job_role):
+                status = "✅ MATCHED" if selected else "❌ NOT MATCHED"
+                st.markdown(f"{status} - {filename} (Score: {score}/100)")
         
-        for result in sorted(results, key=lambda x: x['score'], reverse=True):
-            status = "✅ MATCHED" if result['selected'] else "❌ NOT MATCHED"
-            
-            with st.expander(f"{status} - {result['filename']} (Score: {result['score']}/100)"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("**Strengths:**")
-                    for strength in result['strengths']:
-                        st.success(f"✅ {strength}")
-                
-                with col2:
-                    st.markdown("**Missing Skills:**")
-                    for skill in result['missing_skills']:
-                        st.error(f"❌ {skill}")
+        with st.expander("Show all from this run"):
+            for _, _, filename, score, selected in sorted(rows, key=lambda row: row[3], reverse=True):
+                status = "✅ MATCHED" if selected else "❌ NOT MATCHED"
+                st.markdown(f"{status} - {filename} (Score: {score}/100)")
 
 # Test the functionality
 if __name__ == "__main__":